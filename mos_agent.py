@@ -1,35 +1,73 @@
+from __future__ import annotations
+
 import os
 import logging
 import re
 import json
+import hashlib
+import time
+import shutil
+import queue
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple, Literal
-from urllib.parse import urljoin, urlparse, parse_qs
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple, Literal, AsyncIterator
+from urllib.parse import urljoin, urlencode
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from playwright.async_api import async_playwright, BrowserContext, Page, TimeoutError as PlaywrightTimeoutError
+import orjson
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Request, Response
+from pydantic import BaseModel, ConfigDict, Field
 last_search_data: Optional[Any] = None
 logger = logging.getLogger(__name__)
-from fastapi.responses import HTMLResponse
-from openai import OpenAI
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from playwright.async_api import BrowserContext, Page
 
 
 APP_TITLE = "MOS Agent"
 BASE_URL = "https://support.oracle.com/"
 DASHBOARD_PATH = "epmos/faces/Dashboard"
 KNOWLEDGE_PATH = "epmos/faces/KMConsolidatedSearch"
+DOCUMENT_PATH = "epmos/faces/DocumentDisplay"
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+INDEX_HTML = os.path.join(STATIC_DIR, "index.html")
 PROFILE_DIR = os.getenv("MOS_PROFILE_DIR", "/opt/mos_profile")
 FALLBACK_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".mos_profile")
 _profile_dir_in_use = FALLBACK_PROFILE_DIR
 os.makedirs(_profile_dir_in_use, exist_ok=True)
 PAGE_TIMEOUT_MS = int(os.getenv("MOS_PAGE_TIMEOUT_MS", "30000"))
+# Whole-query deadline (navigate, optional login, search, scrape)
+QUERY_TIMEOUT_MS = int(os.getenv("MOS_QUERY_TIMEOUT_MS", str(PAGE_TIMEOUT_MS * 2)))
 RESULTS_PER_QUERY_LIMIT = 20
+MAX_GENERATED_QUERIES = 25
 HEADLESS_DEFAULT = os.getenv("MOS_HEADLESS", "1").lower() in {"1", "true", "yes"}
+BLOCK_RESOURCES = os.getenv("MOS_BLOCK_RESOURCES", "1").lower() in {"1", "true", "yes"}
 MOS_LOGIN_USER = os.getenv("MOS_LOGIN_USER")
 MOS_LOGIN_PASSWORD = os.getenv("MOS_LOGIN_PASSWORD")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+LOG_CHAR_LIMIT = 12000
+LOG_CHUNK_CHARS = 6000
+LOG_MAX_CHUNKS = 8
+DOCUMENT_CHAR_LIMIT = 20000
+# Below this, the single-evaluate extraction probably missed the document body
+DOCUMENT_SHORT_CHARS = 200
+DOC_CACHE_TTL_S = int(os.getenv("MOS_DOC_CACHE_TTL", "900"))
+SEARCH_CACHE_TTL_S = int(os.getenv("MOS_SEARCH_CACHE_TTL", "120"))
+MAX_TOOL_ROUNDS = 4
+DOC_ID_RE = re.compile(r"^[\w.\-]{1,64}$")
+
+# Log heuristics, combined into one alternation so a log is scanned only once
+_LOG_SIGNATURE_RE = re.compile(
+    r"(?P<internal>(?P<internal_code>(?i:ORA)-0*(?:600|7445))\b[^\[\n]*\[(?P<internal_arg>[^\]\n]+)\])"
+    r"|(?P<code>\b(?i:ORA|TNS|PLS|SP2|RMAN|BEA|OUI|IMP|EXP|KUP|CRS|CLSRSC|PRCR|PRVF|OGG|JBO|ADF|ODI|INS)-\d{3,6}\b)"
+    r"|(?P<exception>\b(?:[a-z_$][\w$]*\.)+[A-Z][\w$]*(?:Exception|Error)\b)"
+)
 
 LLM_TOOLS = [
     {
@@ -70,7 +108,7 @@ LLM_TOOLS = [
                     "max_queries": {
                         "type": "integer",
                         "minimum": 1,
-                        "maximum": 25,
+                        "maximum": MAX_GENERATED_QUERIES,
                         "default": 5,
                     },
                     "max_per_query": {
@@ -172,6 +210,33 @@ LOGIN_SUBMIT_SELECTORS = [
 ]
 
 
+
+def _selector_family(candidates: List[str]) -> Tuple[List[str], str, List[str]]:
+    """Split a fallback chain into one CSS union plus selectors CSS cannot express.
+
+    The chain itself is kept too: a union matches in document order, so the
+    priority between candidates has to be resolved separately.
+    """
+    special = [s for s in candidates if s.startswith(("aria/", "text="))]
+    css = [s for s in candidates if s not in special]
+    return candidates, ", ".join(css), special
+
+
+# A cached selector gets a short look before falling back to the family wait
+CACHED_SELECTOR_PROBE_MS = 500
+
+SELECTOR_FAMILIES: Dict[str, Tuple[List[str], str, List[str]]] = {
+    "search_box": _selector_family(SEARCH_BOX_SELECTORS),
+    "search_trigger": _selector_family(SEARCH_TRIGGER_SELECTORS),
+    "search_submit": _selector_family(SEARCH_SUBMIT_SELECTORS),
+    "login_hint": _selector_family(LOGIN_PAGE_HINTS),
+    "login_username": _selector_family(LOGIN_USERNAME_SELECTORS),
+    "login_password": _selector_family(LOGIN_PASSWORD_SELECTORS),
+    "login_next": _selector_family(LOGIN_NEXT_SELECTORS),
+    "login_submit": _selector_family(LOGIN_SUBMIT_SELECTORS),
+}
+
+
 class SearchRequest(BaseModel):
     queries: List[str] = Field(..., min_items=1, max_items=25)
     max_per_query: int = Field(5, ge=1, le=RESULTS_PER_QUERY_LIMIT)
@@ -179,10 +244,38 @@ class SearchRequest(BaseModel):
 
 class LogSearchRequest(BaseModel):
     log_text: str = Field(..., min_length=1)
-    max_queries: int = Field(5, ge=1, le=25)
+    max_queries: int = Field(5, ge=1, le=MAX_GENERATED_QUERIES)
     max_per_query: int = Field(5, ge=1, le=RESULTS_PER_QUERY_LIMIT)
 
 
+class ChunkQueries(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    chunk: int
+    queries: List[str]
+
+
+class GeneratedQueries(BaseModel):
+    """Structured-output schema for log -> MOS query generation."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    chunks: List[ChunkQueries]
+
+
+GENERATED_QUERIES_SCHEMA = GeneratedQueries.model_json_schema()
+
+
+class LogBatchItem(BaseModel):
+    custom_id: Optional[str] = Field(None, max_length=64)
+    log_text: str = Field(..., min_length=1)
+    max_queries: int = Field(5, ge=1, le=MAX_GENERATED_QUERIES)
+
+
+class LogBatchRequest(BaseModel):
+    items: List[LogBatchItem] = Field(..., min_length=1, max_length=50000)
+
+
 class ChatMessage(BaseModel):
     role: Literal["system", "user", "assistant", "tool"]
     content: str
@@ -193,200 +286,992 @@ class ChatRequest(BaseModel):
     messages: List[ChatMessage]
 
 
-app = FastAPI(title=APP_TITLE, version="1.0.0")
+app = FastAPI(title=APP_TITLE, version="1.0.0", default_response_class=ORJSONResponse)
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+_playwright_mod = None
+_log_listener: Optional[QueueListener] = None
 _play = None
-_ctx: Optional[BrowserContext] = None
 _ctx_lock = asyncio.Lock()
-_ctx_headless: Optional[bool] = None
+# One long-lived pool per head mode, so toggling never tears contexts down
+_pools_by_mode: Dict[bool, "_ContextPool"] = {}
 _openai_client = None
+_token_encoder = None
+
+# Proactive OpenAI throttling (token buckets sized to the account limits)
+OAI_RPM = int(os.getenv("MOS_OAI_RPM", "500"))
+OAI_TPM = int(os.getenv("MOS_OAI_TPM", "200000"))
+OAI_MAX_QUEUE = int(os.getenv("MOS_OAI_MAX_QUEUE", "100"))
+OAI_COMPLETION_TOKENS_EST = 512
+_oai_request_limiter = AsyncLimiter(OAI_RPM, 60)
+_oai_token_limiter = AsyncLimiter(OAI_TPM, 60)
+_oai_waiting = 0
+
+# Warm BrowserContexts shared by concurrent requests; each owns a profile copy
+MOS_CONTEXT_POOL_SIZE = max(1, int(os.getenv("MOS_CONTEXT_POOL_SIZE", "2")))
+MOS_CONTEXT_WARM = int(os.getenv("MOS_CONTEXT_WARM", "0"))
+MOS_CONTEXT_MAX_IDLE_S = float(os.getenv("MOS_CONTEXT_MAX_IDLE_S", "900"))
+
+# Concurrent tabs used to fan out multi-query searches
+MOS_MAX_PAGES = max(1, int(os.getenv("MOS_MAX_PAGES", "4")))
+_page_semaphore = asyncio.Semaphore(MOS_MAX_PAGES)
+
+# Repeat searches (e.g. the chat LLM re-issuing a tool call) skip the browser
+_search_cache: TTLCache = TTLCache(maxsize=512, ttl=SEARCH_CACHE_TTL_S)
+# Doc IDs are stable; skip the browser round-trip for recently fetched documents
+_doc_cache: TTLCache = TTLCache(maxsize=1024, ttl=DOC_CACHE_TTL_S)
 
+with open(INDEX_HTML, "rb") as _fh:
+    _INDEX_ETAG = f'"{hashlib.md5(_fh.read()).hexdigest()}"'
 
+RESULT_LINK_SELECTOR = 'a[href*="DocumentDisplay" i]'
+# The Dashboard itself lists DocumentDisplay links (favourites, recent items)
+RESULTS_URL_RE = re.compile(re.escape(KNOWLEDGE_PATH), re.IGNORECASE)
 
-async def _ensure_context(headless: bool) -> BrowserContext:
-    global _play, _ctx, _ctx_headless, _profile_dir_in_use
-    if _ctx is not None and _ctx_headless == headless:
-        return _ctx
+# Scrape a whole result page in one evaluate() instead of per-element round-trips
+_SCRAPE_RESULTS_JS = """
+({selector, limit}) => {
+    const seen = new Set();
+    const results = [];
+    for (const link of document.querySelectorAll(selector)) {
+        if (results.length >= limit) break;
+        const title = (link.innerText || '').trim();
+        if (!link.href || !title) continue;
+        const params = new URL(link.href, location.href).searchParams;
+        const docId = params.get('id') || params.get('docId') || params.get('doc_id');
+        const key = docId || link.href;
+        if (seen.has(key)) continue;
+        seen.add(key);
+        const row = link.closest('tr, li, [role="row"]');
+        const snippet = (row ? row.innerText : '').replace(title, '').replace(/\\s+/g, ' ').trim();
+        results.push({title, doc_id: docId, url: link.href, snippet});
+    }
+    return results;
+}
+"""
+
+# Document bodies are rendered inside (same-origin) iframes; keep the richest one
+_EXTRACT_DOCUMENT_JS = """
+() => {
+    let best = document.body ? document.body.innerText : '';
+    let blocked = 0;
+    const walk = (doc) => {
+        for (const frame of doc.querySelectorAll('iframe, frame')) {
+            let inner = null;
+            try { inner = frame.contentDocument; } catch (e) {}
+            // Cross-origin frames expose no contentDocument
+            if (!inner) { blocked++; continue; }
+            if (!inner.body) continue;
+            if (inner.body.innerText.length > best.length) best = inner.body.innerText;
+            walk(inner);
+        }
+    };
+    walk(document);
+    return {title: document.title, content: best, blocked};
+}
+"""
+CHROMIUM_ARGS = ["--disable-gpu", "--disable-dev-shm-usage", "--no-sandbox"]
+
+# Scraping only needs HTML + XHR; everything else is page weight
+BLOCKED_RESOURCE_TYPES = {
+    "image",
+    "imageset",
+    "font",
+    "media",
+    "stylesheet",
+    "beacon",
+    "websocket",
+    "texttrack",
+    "csp_report",
+    "object",
+}
+
+
+async def _block_heavy(route) -> None:
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def _pw():
+    """Import ``playwright.async_api`` on first use so serving ``/`` stays light."""
+    global _playwright_mod
+    if _playwright_mod is None:
+        import playwright.async_api as _playwright_mod
+    return _playwright_mod
+
+
+def _seed_profile(base_dir: str, profile_dir: str) -> None:
+    """Copy the base profile (cookies, MOS session) into a pool slot on first use."""
+    if os.path.isdir(profile_dir):
+        return
+    os.makedirs(base_dir, exist_ok=True)
+    shutil.copytree(
+        base_dir,
+        profile_dir,
+        ignore=shutil.ignore_patterns("headless", "headful", "ctx-*", "Singleton*", "*.lock"),
+    )
+
+
+async def _launch_context(headless: bool, slot: int) -> BrowserContext:
+    global _play, _profile_dir_in_use
     async with _ctx_lock:
-        if _ctx is not None and _ctx_headless == headless:
-            return _ctx
-        # Recreate context with desired head mode
-        if _ctx is not None:
-            await _ctx.close()
-            _ctx = None
         if _play is None:
-            _play = await async_playwright().start()
-        print(f"[mos_agent] launching Playwright context (headless={headless})")
-        launch_error: Optional[Exception] = None
-        attempted_paths: List[str] = []
-        candidate_paths: List[str] = []
-        for cand in (_profile_dir_in_use, PROFILE_DIR, FALLBACK_PROFILE_DIR):
-            if cand and cand not in candidate_paths:
-                candidate_paths.append(cand)
-        for candidate in candidate_paths:
-            attempted_paths.append(candidate)
+            _play = await _pw().async_playwright().start()
+    logger.info("launching Playwright context %d headless=%s", slot, headless)
+    ctx: Optional[BrowserContext] = None
+    launch_error: Optional[Exception] = None
+    attempted_paths: List[str] = []
+    candidate_paths: List[str] = []
+    for cand in (_profile_dir_in_use, PROFILE_DIR, FALLBACK_PROFILE_DIR):
+        if cand and cand not in candidate_paths:
+            candidate_paths.append(cand)
+    for candidate in candidate_paths:
+        profile_dir = os.path.join(candidate, "headless" if headless else "headful", f"ctx-{slot}")
+        attempted_paths.append(profile_dir)
+        try:
+            _seed_profile(candidate, profile_dir)
+        except PermissionError:
+            logger.warning("cannot create profile dir %s: permission denied", profile_dir)
+            continue
+        try:
+            ctx = await _play.chromium.launch_persistent_context(
+                profile_dir, headless=headless, args=CHROMIUM_ARGS
+            )
+        except Exception as exc:
+            launch_error = exc
+            logger.warning("failed to launch context with profile %s: %s", profile_dir, exc)
+            continue
+        _profile_dir_in_use = candidate
+        break
+    if ctx is None:
+        raise RuntimeError(
+            f"Unable to launch Playwright context (tried: {', '.join(attempted_paths)})"
+        ) from launch_error
+    ctx.set_default_timeout(PAGE_TIMEOUT_MS)
+    if BLOCK_RESOURCES:
+        await ctx.route("**/*", _block_heavy)
+    ctx._mos_slot = slot
+    ctx._mos_closed = False
+    ctx._mos_page_pool = asyncio.Queue()
+    ctx._mos_selector_cache = {}
+    ctx.on("close", lambda _: setattr(ctx, "_mos_closed", True))
+    return ctx
+
+
+class _ContextPool:
+    """Fixed-size pool of persistent contexts with acquire/release semantics."""
+
+    def __init__(self, headless: bool, size: int = MOS_CONTEXT_POOL_SIZE):
+        self.headless = headless
+        self.size = size
+        self.created = 0
+        self.reused = 0
+        self.in_use = 0
+        self._closed = False
+        self._sem = asyncio.Semaphore(size)
+        self._idle: "asyncio.Queue[Tuple[BrowserContext, float]]" = asyncio.Queue()
+        self._free_slots: List[int] = list(range(size))
+        # Slots handed back while their old context is still shutting down
+        self._closing: Dict[int, asyncio.Event] = {}
+
+    async def _create(self) -> BrowserContext:
+        slot = self._free_slots.pop(0)
+        try:
+            closing = self._closing.get(slot)
+            if closing is not None:
+                # Chromium holds the profile dir until the previous context exits
+                await closing.wait()
+            ctx = await _launch_context(self.headless, slot)
+        except Exception:
+            self._free_slots.append(slot)
+            raise
+        self.created += 1
+        return ctx
+
+    async def _checkout(self) -> BrowserContext:
+        while not self._idle.empty():
+            ctx, _ = self._idle.get_nowait()
+            if ctx._mos_closed:
+                self._free_slots.append(ctx._mos_slot)
+                continue
+            self.reused += 1
+            return ctx
+        # Slots are only ever held by idle contexts or semaphore holders, so with
+        # nothing idle the semaphore guarantees a free slot
+        return await self._create()
+
+    async def _checkin(self, ctx: BrowserContext) -> None:
+        if self._closed or ctx._mos_closed:
+            if not ctx._mos_closed:
+                await ctx.close()
+            self._free_slots.append(ctx._mos_slot)
+            return
+        self._idle.put_nowait((ctx, time.monotonic()))
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[BrowserContext]:
+        async with self._sem:
+            ctx = await self._checkout()
+            self.in_use += 1
+            try:
+                yield ctx
+            finally:
+                self.in_use -= 1
+                await self._checkin(ctx)
+
+    async def warm_up(self, n: int) -> None:
+        for _ in range(min(n, self.size)):
+            async with self._sem:
+                ctx = await self._create()
+                self._idle.put_nowait((ctx, time.monotonic()))
+
+    async def close_idle(self, max_idle_s: float) -> int:
+        # Partition without awaiting so acquire() never sees a context or slot in limbo
+        now = time.monotonic()
+        keep: List[Tuple[BrowserContext, float]] = []
+        expired: List[BrowserContext] = []
+        while not self._idle.empty():
+            ctx, since = self._idle.get_nowait()
+            if ctx._mos_closed or now - since > max_idle_s:
+                expired.append(ctx)
+            else:
+                keep.append((ctx, since))
+        for item in keep:
+            self._idle.put_nowait(item)
+        for ctx in expired:
+            self._closing[ctx._mos_slot] = asyncio.Event()
+            self._free_slots.append(ctx._mos_slot)
+        for ctx in expired:
+            try:
+                if not ctx._mos_closed:
+                    await ctx.close()
+            except Exception as exc:
+                # The slot is already free; a dead driver must not strand the others
+                logger.warning("closing idle browser context %d failed: %s", ctx._mos_slot, exc)
+            finally:
+                self._closing.pop(ctx._mos_slot).set()
+        return len(expired)
+
+    async def close(self) -> None:
+        self._closed = True
+        await self.close_idle(-1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "headless": self.headless,
+            "size": self.size,
+            "created": self.created,
+            "reused": self.reused,
+            "inUse": self.in_use,
+            "idle": self._idle.qsize(),
+        }
+
+
+def _get_pool(headless: bool) -> _ContextPool:
+    pool = _pools_by_mode.get(headless)
+    if pool is None:
+        pool = _pools_by_mode[headless] = _ContextPool(headless)
+    return pool
+
+
+@asynccontextmanager
+async def _acquire_context(headless: bool) -> AsyncIterator[BrowserContext]:
+    pool = _get_pool(headless)
+    async with pool.acquire() as ctx:
+        yield ctx
+
+
+async def _reap_idle_contexts() -> None:
+    while True:
+        await asyncio.sleep(min(60.0, MOS_CONTEXT_MAX_IDLE_S))
+        for pool in list(_pools_by_mode.values()):
             try:
-                os.makedirs(candidate, exist_ok=True)
-            except PermissionError:
-                print(f"[mos_agent] cannot create profile dir {candidate}: permission denied")
+                closed = await pool.close_idle(MOS_CONTEXT_MAX_IDLE_S)
+            except Exception:
+                logger.exception("idle context reaping failed")
+                continue
+            if closed:
+                logger.info("closed %d idle MOS browser contexts", closed)
+
+
+def _start_log_listener() -> None:
+    """Route this module's logs through a queue so handlers never block the event loop."""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [mos_agent] %(message)s"))
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    _log_listener = QueueListener(log_queue, stream_handler)
+    _log_listener.start()
+
+
+@app.on_event("startup")
+async def _startup() -> None:
+    _start_log_listener()
+    app.state.reaper = asyncio.create_task(_reap_idle_contexts())
+    if OPENAI_API_KEY:
+        # Estimates fall back to character counts until the encoder is ready
+        app.state.token_encoder = asyncio.create_task(asyncio.to_thread(_load_token_encoder))
+    if MOS_CONTEXT_WARM > 0:
+        try:
+            await _get_pool(HEADLESS_DEFAULT).warm_up(MOS_CONTEXT_WARM)
+        except Exception as exc:
+            logger.warning("browser context warm-up failed: %s", exc)
+
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    global _play
+    app.state.reaper.cancel()
+    for pool in _pools_by_mode.values():
+        await pool.close()
+    if _play is not None:
+        await _play.stop()
+        _play = None
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "contexts": [pool.stats() for pool in _pools_by_mode.values()]}
+
+
+def _locator(page: Page, selector: str):
+    """Resolve a selector, translating recorder-style ``aria/Name[role="x"]`` entries."""
+    if selector.startswith("aria/"):
+        match = re.match(r'aria/(.+?)(?:\[role="(\w+)"\])?$', selector)
+        if match:
+            name, role = match.groups()
+            return page.get_by_role(role or "textbox", name=name)
+    return page.locator(selector)
+
+
+def _visible(page: Page, selector: str):
+    # Only consider visible matches so a hidden early match cannot shadow the rest
+    return _locator(page, selector).locator("visible=true").first
+
+
+async def _first_matching(page: Page, kind: str, timeout: int = 5000):
+    """Return the highest-priority visible element of a selector family.
+
+    A single wait covers the whole family (the CSS union or'ed with the
+    recorder/text selectors); the chain is then walked in order with instant
+    visibility checks so the most specific candidate wins. That concrete
+    selector is cached on the BrowserContext per ``kind``; a cached entry only
+    gets a brief probe, and is replaced when another candidate wins the walk.
+    """
+    cache: Dict[str, str] = page.context._mos_selector_cache
+    cached = cache.get(kind)
+    if cached is not None:
+        loc = _visible(page, cached)
+        try:
+            await loc.wait_for(state="visible", timeout=min(timeout, CACHED_SELECTOR_PROBE_MS))
+            return loc
+        except _pw().TimeoutError:
+            # Not evicted: the field may simply not be rendered yet (IDCS two-step login)
+            pass
+    candidates, union, special = SELECTOR_FAMILIES[kind]
+    family = page.locator(union) if union else None
+    for selector in special:
+        loc = _locator(page, selector)
+        family = loc if family is None else family.or_(loc)
+    try:
+        await family.locator("visible=true").first.wait_for(state="visible", timeout=timeout)
+    except _pw().TimeoutError:
+        return None
+    for selector in candidates:
+        loc = _visible(page, selector)
+        if await loc.count():
+            cache[kind] = selector
+            return loc
+    return None
+
+
+async def _is_login_page(page: Page) -> bool:
+    _, union, special = SELECTOR_FAMILIES["login_hint"]
+    if union and await page.locator(union).locator("visible=true").count():
+        return True
+    for selector in special:
+        if await page.locator(selector).count():
+            return True
+    return False
+
+
+async def _perform_login(page: Page) -> None:
+    if not (MOS_LOGIN_USER and MOS_LOGIN_PASSWORD):
+        raise HTTPException(status_code=401, detail="MOS login required; set MOS_LOGIN_USER/MOS_LOGIN_PASSWORD")
+    user_box = await _first_matching(page, "login_username")
+    if user_box is None:
+        raise HTTPException(status_code=502, detail="MOS login form not recognised")
+    await user_box.fill(MOS_LOGIN_USER)
+    password_box = await _first_matching(page, "login_password", timeout=1000)
+    if password_box is None:
+        # IDCS two-step form: username first, then password
+        next_button = await _first_matching(page, "login_next", timeout=2000)
+        if next_button is not None:
+            await next_button.click()
+        password_box = await _first_matching(page, "login_password", timeout=PAGE_TIMEOUT_MS)
+    if password_box is None:
+        raise HTTPException(status_code=502, detail="MOS password field not found")
+    await password_box.fill(MOS_LOGIN_PASSWORD)
+    submit = await _first_matching(page, "login_submit", timeout=2000)
+    if submit is not None:
+        await submit.click()
+    else:
+        await password_box.press("Enter")
+    await page.wait_for_url(re.compile(r".*support\.oracle\.com/epmos/.*"), timeout=PAGE_TIMEOUT_MS)
+
+
+async def _goto(page: Page, url: str) -> None:
+    await page.goto(url, wait_until="domcontentloaded")
+    if await _is_login_page(page):
+        await _perform_login(page)
+        await page.goto(url, wait_until="domcontentloaded")
+
+
+async def _open_dashboard(page: Page) -> None:
+    await _goto(page, urljoin(BASE_URL, DASHBOARD_PATH))
+
+
+async def _find_search_box(page: Page):
+    box = await _first_matching(page, "search_box")
+    if box is None:
+        trigger = await _first_matching(page, "search_trigger", timeout=2000)
+        if trigger is not None:
+            await trigger.click()
+            box = await _first_matching(page, "search_box")
+    if box is None:
+        raise HTTPException(status_code=502, detail="MOS global search box not found")
+    return box
+
+
+async def _submit_search(page: Page, query: str) -> None:
+    box = await _find_search_box(page)
+    await box.click()
+    await box.fill(query)
+    submit = await _first_matching(page, "search_submit", timeout=2000)
+    if submit is not None:
+        await submit.click()
+    else:
+        await box.press("Enter")
+    # Only count result links once we are off the Dashboard
+    await page.wait_for_url(RESULTS_URL_RE, timeout=PAGE_TIMEOUT_MS)
+    await page.wait_for_selector(RESULT_LINK_SELECTOR, timeout=PAGE_TIMEOUT_MS)
+
+
+async def _scrape_results(page: Page, query: str, max_per_query: int) -> List[Dict[str, Any]]:
+    rows = await page.evaluate(
+        _SCRAPE_RESULTS_JS, {"selector": RESULT_LINK_SELECTOR, "limit": max_per_query}
+    )
+    return [{"query": query, **row} for row in rows]
+
+
+@asynccontextmanager
+async def _borrow_page(ctx: BrowserContext) -> AsyncIterator[Page]:
+    async with _page_semaphore:
+        page_pool: "asyncio.Queue[Page]" = ctx._mos_page_pool
+        try:
+            page = page_pool.get_nowait()
+        except asyncio.QueueEmpty:
+            # The semaphore caps how many tabs can ever be opened here
+            page = await ctx.new_page()
+        try:
+            yield page
+        finally:
+            if not page.is_closed():
+                page_pool.put_nowait(page)
+
+
+async def _run_one(ctx: BrowserContext, query: str, max_per_query: int) -> List[Dict[str, Any]]:
+    async with _borrow_page(ctx) as page:
+        try:
+            async with asyncio.timeout(QUERY_TIMEOUT_MS / 1000):
+                await _open_dashboard(page)
+                try:
+                    await _submit_search(page, query)
+                except _pw().TimeoutError:
+                    logger.warning("no MOS results for query %r", query)
+                    return []
+                return await _scrape_results(page, query, max_per_query)
+        except TimeoutError:
+            logger.warning("MOS query %r exceeded %d ms, dropping it", query, QUERY_TIMEOUT_MS)
+            return []
+        finally:
+            # Halt pending navigations/XHRs before the tab goes back to the pool
+            if not page.is_closed():
+                try:
+                    # A wedged renderer must not hold the page slot forever
+                    await asyncio.wait_for(page.evaluate("window.stop()"), 1)
+                except (_pw().Error, TimeoutError):
+                    pass
+
+
+def _search_cache_key(query: str, max_per_query: int) -> Tuple[str, int]:
+    return query.strip().lower(), max_per_query
+
+
+async def _execute_queries(
+    queries: List[str], max_per_query: int, headless: bool = HEADLESS_DEFAULT
+) -> List[Dict[str, Any]]:
+    # The LLM sometimes emits the same query twice; run each distinct one once
+    cleaned: Dict[Tuple[str, int], str] = {}
+    for q in queries:
+        if q and q.strip():
+            cleaned.setdefault(_search_cache_key(q, max_per_query), q.strip())
+    found: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+    misses: List[Tuple[Tuple[str, int], str]] = []
+    for key, q in cleaned.items():
+        hit = _search_cache.get(key)
+        if hit is None:
+            misses.append((key, q))
+        else:
+            found[key] = hit
+    if misses:
+        async with _acquire_context(headless) as ctx:
+            tasks = [asyncio.create_task(_run_one(ctx, q, max_per_query)) for _, q in misses]
+            per_query = await asyncio.gather(*tasks, return_exceptions=True)
+        failures = [r for r in per_query if isinstance(r, BaseException)]
+        if failures and len(failures) == len(per_query):
+            raise failures[0]
+        for (key, q), results in zip(misses, per_query):
+            if isinstance(results, BaseException):
+                logger.warning("MOS query %r failed: %s", q, results)
+                results = []
+            found[key] = results
+            if results:
+                _search_cache[key] = results
+    return [item for key in cleaned for item in found[key]]
+
+
+async def _fetch_document(doc_id: str, headless: bool = HEADLESS_DEFAULT) -> Dict[str, Any]:
+    doc_id = doc_id.strip()
+    if not DOC_ID_RE.match(doc_id):
+        raise HTTPException(status_code=400, detail=f"Invalid Doc ID: {doc_id!r}")
+    cached = _doc_cache.get(doc_id)
+    if cached is not None:
+        return cached
+    url = f"{urljoin(BASE_URL, DOCUMENT_PATH)}?{urlencode({'id': doc_id})}"
+    async with _acquire_context(headless) as ctx, _borrow_page(ctx) as page:
+        await _goto(page, url)
+        try:
+            await page.wait_for_load_state("networkidle", timeout=PAGE_TIMEOUT_MS // 3)
+        except _pw().TimeoutError:
+            pass
+        extracted = await page.evaluate(_EXTRACT_DOCUMENT_JS)
+        if extracted["blocked"] or len(extracted["content"].strip()) < DOCUMENT_SHORT_CHARS:
+            # Playwright can reach cross-origin frames the page script cannot
+            for frame in page.frames:
+                try:
+                    text = await frame.evaluate("() => document.body ? document.body.innerText : ''")
+                except _pw().Error:
+                    continue
+                if len(text) > len(extracted["content"]):
+                    extracted["content"] = text
+    document = {
+        "doc_id": doc_id,
+        "title": extracted["title"],
+        "url": url,
+        "content": extracted["content"].strip()[:DOCUMENT_CHAR_LIMIT],
+    }
+    if document["content"]:
+        _doc_cache[doc_id] = document
+    return document
+
+
+def _dumps(data: Any) -> str:
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _get_openai_client() -> AsyncOpenAI:
+    global _openai_client
+    if _openai_client is None:
+        if not OPENAI_API_KEY:
+            raise HTTPException(status_code=503, detail="OPENAI_API_KEY is not configured")
+        from openai import AsyncOpenAI
+
+        _openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+
+def _load_token_encoder() -> None:
+    """Load the tiktoken encoding; blocking (it may download BPE files), so run it in a thread."""
+    global _token_encoder
+    try:
+        import tiktoken
+
+        try:
+            _token_encoder = tiktoken.encoding_for_model(OPENAI_MODEL)
+        except KeyError:
+            _token_encoder = tiktoken.get_encoding("o200k_base")
+    except Exception as exc:
+        # Offline hosts cannot fetch the BPE files; keep the ~4 chars/token estimate
+        logger.warning("tiktoken unavailable, estimating tokens from length: %s", exc)
+
+
+def _estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    text = "".join(str(m.get("content") or "") for m in messages)
+    # Never load the encoder here: that would block the event loop
+    prompt_tokens = len(_token_encoder.encode(text)) if _token_encoder is not None else len(text) // 4
+    # ~4 tokens of framing per message plus the expected completion
+    return prompt_tokens + 4 * len(messages) + OAI_COMPLETION_TOKENS_EST
+
+
+async def _throttled_create(**body: Any) -> Any:
+    """Wait for RPM/TPM budget before calling the API instead of retrying on 429s."""
+    global _oai_waiting
+    if _oai_waiting >= OAI_MAX_QUEUE:
+        raise HTTPException(status_code=429, detail="OpenAI request queue is full, retry later")
+    tokens = min(_estimate_tokens(body["messages"]), OAI_TPM)
+    _oai_waiting += 1
+    try:
+        await _oai_request_limiter.acquire()
+        await _oai_token_limiter.acquire(tokens)
+    finally:
+        _oai_waiting -= 1
+    return await _get_openai_client().chat.completions.create(**body)
+
+
+def _split_log(log_text: str) -> List[str]:
+    """Split a log into line-aligned chunks, keeping the tail where errors usually are."""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for line in log_text.splitlines():
+        line = line[:LOG_CHUNK_CHARS]
+        if current and size + len(line) > LOG_CHUNK_CHARS:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks[-LOG_MAX_CHUNKS:]
+
+
+def _extract_log_signatures(log_text: str) -> List[str]:
+    """Pull error codes, ORA-600/7445 arguments and exception classes in one scan."""
+    signatures: List[str] = []
+    for match in _LOG_SIGNATURE_RE.finditer(log_text):
+        if match.group("internal"):
+            signature = f"{match.group('internal_code').upper()} {match.group('internal_arg').strip()}"
+        elif match.group("code"):
+            signature = match.group("code").upper()
+        else:
+            signature = match.group("exception")
+        if signature not in signatures:
+            signatures.append(signature)
+    return signatures
+
+
+def _log_query_request(log_text: str, max_queries: int) -> Optional[Dict[str, Any]]:
+    """Build the chat-completion body deriving MOS queries for every log chunk at once."""
+    chunks = _split_log(log_text)
+    if not chunks:
+        return None
+    numbered = "\n\n".join(
+        f"=== CHUNK {i} ===\n{chunk}" for i, chunk in enumerate(chunks, start=1)
+    )
+    signatures = _extract_log_signatures(log_text)
+    hint = f" Error signatures found in the log: {', '.join(signatures[:20])}." if signatures else ""
+    return {
+        "model": OPENAI_MODEL,
+        "temperature": 0,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "generated_queries", "strict": True, "schema": GENERATED_QUERIES_SCHEMA},
+        },
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You turn Oracle error logs into My Oracle Support search queries. "
+                    "The log is split into numbered chunks. For each chunk return its number and "
+                    f"queries, with up to {max_queries} short, distinct queries in total, focusing on "
+                    "error codes (ORA-, TNS-, BEA-, etc.) and the failing component. "
+                    "Omit chunks with nothing worth searching."
+                    + hint
+                ),
+            },
+            {"role": "user", "content": numbered},
+        ],
+    }
+
+
+def _parse_generated_queries(content: Optional[str], max_queries: int) -> List[str]:
+    generated = GeneratedQueries.model_validate_json(content or "{}")
+    per_chunk = [[q.strip() for q in entry.queries if q.strip()] for entry in generated.chunks]
+    # Round-robin across chunks so one noisy chunk cannot crowd out the rest
+    queries: List[str] = []
+    seen: set = set()
+    for rank in range(max((len(qs) for qs in per_chunk), default=0)):
+        for qs in per_chunk:
+            if rank < len(qs) and qs[rank].lower() not in seen:
+                seen.add(qs[rank].lower())
+                queries.append(qs[rank])
+    return queries[:max_queries]
+
+
+async def _generate_queries_from_log(log_text: str, max_queries: int) -> List[str]:
+    if not OPENAI_API_KEY:
+        # Without an LLM, the regex signatures are still decent MOS queries
+        return _extract_log_signatures(log_text)[:max_queries]
+    body = _log_query_request(log_text, max_queries)
+    if body is None:
+        return []
+    completion = await _throttled_create(**body)
+    try:
+        return _parse_generated_queries(completion.choices[0].message.content, max_queries)
+    except ValueError:
+        raise HTTPException(status_code=502, detail="LLM returned malformed query JSON")
+
+
+def _split_batch_custom_id(raw: str) -> Tuple[str, int]:
+    """Undo the ``<max_queries>:<custom_id>`` encoding used for batch requests."""
+    limit, sep, custom_id = raw.partition(":")
+    if sep and limit.isdigit():
+        return custom_id, int(limit)
+    return raw, MAX_GENERATED_QUERIES
+
+
+async def _submit_log_batch(items: List["LogBatchItem"]) -> str:
+    """Upload one chat-completion request per log to the OpenAI Batch API."""
+    custom_ids = [item.custom_id or f"log-{i}" for i, item in enumerate(items)]
+    if len(custom_ids) != len(set(custom_ids)):
+        raise HTTPException(status_code=400, detail="custom_id values must be unique")
+    lines: List[str] = []
+    for custom_id, item in zip(custom_ids, items):
+        body = _log_query_request(item.log_text, item.max_queries)
+        if body is None:
+            continue
+        entry = {
+            # Batch output only echoes custom_id, so it carries the per-item query limit
+            "custom_id": f"{item.max_queries}:{custom_id}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body,
+        }
+        lines.append(orjson.dumps(entry).decode())
+    if not lines:
+        raise HTTPException(status_code=400, detail="No log content to analyse")
+    client = _get_openai_client()
+    batch_file = await client.files.create(
+        file=("mos_log_batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id
+
+
+async def _collect_log_batch(batch_id: str) -> Dict[str, Any]:
+    from openai import NotFoundError
+
+    client = _get_openai_client()
+    try:
+        batch = await client.batches.retrieve(batch_id)
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown batch: {batch_id!r}")
+    status: Dict[str, Any] = {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "request_counts": batch.request_counts.model_dump() if batch.request_counts else None,
+    }
+    if batch.status != "completed":
+        return status
+    results: List[Dict[str, Any]] = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id, max_queries = _split_batch_custom_id(record.get("custom_id") or "")
+            item: Dict[str, Any] = {"custom_id": custom_id}
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                item["error"] = record.get("error") or response.get("body")
+            else:
+                message = response["body"]["choices"][0]["message"]
+                try:
+                    item["generated_queries"] = _parse_generated_queries(
+                        message.get("content"), max_queries
+                    )
+                except ValueError:
+                    item["error"] = "malformed query JSON"
+            results.append(item)
+    status["results"] = results
+    return status
+
+
+async def _search_from_log(req: LogSearchRequest) -> Dict[str, Any]:
+    global last_search_data
+    queries = await _generate_queries_from_log(req.log_text, req.max_queries)
+    results = await _execute_queries(queries, req.max_per_query) if queries else []
+    last_search_data = results
+    return {"generated_queries": queries, "results": results}
+
+
+async def _dispatch_tool(name: str, arguments: str) -> Any:
+    global last_search_data
+    try:
+        args = json.loads(arguments or "{}")
+        if name == "search_mos":
+            req = SearchRequest(**args)
+            last_search_data = await _execute_queries(req.queries, req.max_per_query)
+            return last_search_data
+        if name == "search_mos_from_log":
+            return await _search_from_log(LogSearchRequest(**args))
+        if name == "get_document":
+            return await _fetch_document(str(args.get("doc_id", "")))
+    except ValueError as exc:
+        return {"error": f"invalid arguments for {name}: {exc}"}
+    except HTTPException as exc:
+        return {"error": exc.detail}
+    except Exception as exc:
+        # Browser failures (timeouts, launch errors) go back to the model, not out as a 500
+        logger.exception("tool %s failed", name)
+        return {"error": f"{name} failed: {exc}"}
+    return {"error": f"unknown tool {name}"}
+
+
+def _chat_system_prompt() -> str:
+    prompt = (
+        "You are an Oracle support engineer helping a DBA/sysadmin. Use the tools to search "
+        "My Oracle Support and read documents; always cite Doc IDs for your answers."
+    )
+    if last_search_data:
+        prompt += "\n\nLatest MOS search results:\n" + _dumps(last_search_data)[:LOG_CHAR_LIMIT]
+    return prompt
+
+
+def _chat_messages(req: ChatRequest) -> List[Dict[str, Any]]:
+    messages: List[Dict[str, Any]] = [{"role": "system", "content": _chat_system_prompt()}]
+    messages += [m.model_dump(exclude_none=True) for m in req.messages]
+    return messages
+
+
+def _sse(data: Dict[str, Any]) -> str:
+    return f"data: {_dumps(data)}\n\n"
+
+
+async def _sse_gen(messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    from openai import APIError
+
+    for _ in range(MAX_TOOL_ROUNDS):
+        # Tool calls arrive as fragments keyed by index; stitch them back together
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        try:
+            stream = await _throttled_create(
+                model=OPENAI_MODEL, messages=messages, tools=LLM_TOOLS, stream=True
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    yield _sse({"delta": delta.content})
+                for call in delta.tool_calls or []:
+                    entry = tool_calls.setdefault(
+                        call.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+                    )
+                    if call.id:
+                        entry["id"] = call.id
+                    if call.function and call.function.name:
+                        entry["function"]["name"] += call.function.name
+                    if call.function and call.function.arguments:
+                        entry["function"]["arguments"] += call.function.arguments
+        except HTTPException as exc:
+            yield _sse({"error": exc.detail})
+            return
+        except APIError as exc:
+            # The response has already started; report the failure in-band
+            logger.warning("OpenAI stream failed: %s", exc)
+            yield _sse({"error": f"OpenAI error: {exc.message}"})
+            return
+        if not tool_calls:
+            yield _sse({"done": True})
+            return
+        calls = [tool_calls[i] for i in sorted(tool_calls)]
+        messages.append({"role": "assistant", "tool_calls": calls})
+        for call in calls:
+            yield _sse({"tool": call["function"]["name"]})
+            result = await _dispatch_tool(call["function"]["name"], call["function"]["arguments"])
+            messages.append({"role": "tool", "tool_call_id": call["id"], "content": _dumps(result)})
+    yield _sse({"error": "LLM did not finish after tool calls"})
 
 
 @app.post("/search")
-async def search(req: SearchRequest):
+async def search(req: SearchRequest, response: Response):
     global last_search_data
+    keys = [_search_cache_key(q, req.max_per_query) for q in req.queries if q.strip()]
+    cached = bool(keys) and all(key in _search_cache for key in keys)
     result = await _execute_queries(req.queries, req.max_per_query)
+    response.headers["X-Cache"] = "HIT" if cached else "MISS"
     last_search_data = result
     return result
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    return """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>MOS Agent</title>
-    <style>
-        body { font-family: Arial, sans-serif; margin: 20px; }
-        .container { max-width: 1200px; margin: 0 auto; }
-        h1 { color: #333; }
-        .section { margin-bottom: 30px; border: 1px solid #ddd; padding: 20px; border-radius: 5px; }
-        input, textarea, button { padding: 8px; margin: 5px; }
-        button { background: #007bff; color: white; border: none; cursor: pointer; }
-        button:hover { background: #0056b3; }
-        #results { margin-top: 20px; }
-        .result { border: 1px solid #ccc; padding: 10px; margin: 10px 0; border-radius: 5px; background: #f9f9f9; }
-        .result:hover { background: #f0f0f0; }
-        #chat { height: 300px; overflow-y: auto; border: 1px solid #ccc; padding: 10px; margin-bottom: 10px; }
-        .message { margin: 5px 0; }
-        .user { color: #007bff; }
-        .assistant { color: #28a745; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>MOS Agent</h1>
-        
-        <div class="section">
-            <h2>Direct MOS Search</h2>
-            <input type="text" id="query" placeholder="Enter search terms (e.g., ORA-00600)">
-            <input type="number" id="maxPerQuery" value="5" min="1" max="20" title="Max results per query">
-            <button onclick="runSearch()">Search</button>
-        </div>
-        
-        <div class="section">
-            <h2>Search from Log</h2>
-            <textarea id="logText" rows="8" placeholder="Paste error log or stack trace here"></textarea><br>
-            <input type="number" id="maxQueries" value="4" min="1" max="25" title="Max queries to generate">
-            <input type="number" id="maxPerQueryLog" value="5" min="1" max="20" title="Max results per query">
-            <button onclick="runLogSearch()">Search from Log</button>
-        </div>
-        
-        <div class="section">
-            <h2>Chat about Results</h2>
-            <div id="chat"></div>
-            <input type="text" id="message" placeholder="Ask questions about the search results" style="width: 70%;">
-            <button onclick="sendMessage()">Send</button>
-        </div>
-        
-        <div id="results"></div>
-    </div>
-    
-    <script>
-        let messages = [];
-        async function runSearch() {
-            const query = document.getElementById('query').value.trim();
-            if (!query) {
-                alert('Please enter a search query');
-                return;
-            }
-            const maxPer = parseInt(document.getElementById('maxPerQuery').value);
-            const resp = await fetch('/search', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ queries: [query], max_per_query: maxPer })
-            });
-            const data = await resp.json();
-            renderResults(data);
-        }
-        
-        async function runLogSearch() {
-            const log = document.getElementById('logText').value.trim();
-            if (!log) {
-                alert('Please paste log text first');
-                return;
-            }
-            const maxQueries = parseInt(document.getElementById('maxQueries').value);
-            const maxPer = parseInt(document.getElementById('maxPerQueryLog').value);
-            const resp = await fetch('/search/log', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ log_text: log, max_queries: maxQueries, max_per_query: maxPer })
-            });
-            const data = await resp.json();
-            renderResults(data.results || []);
-            if (data.generated_queries && data.generated_queries.length > 0) {
-                chatter('assistant', 'Generated queries: ' + data.generated_queries.join(', '));
-            }
-        }
-        
-        async function sendMessage() {
-            const message = document.getElementById('message').value.trim();
-            if (!message) return;
-            document.getElementById('message').value = '';
-            messages.push({ role: 'user', content: message });
-            chatter('user', message);
-            const resp = await fetch('/chat', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ messages: messages })
-            });
-            const data = await resp.json();
-            if (data.reply) {
-                messages.push({ role: 'assistant', content: data.reply });
-                chatter('assistant', data.reply);
-            } else {
-                chatter('assistant', 'No response');
-            }
-        }
-        
-        function renderResults(results) {
-            const container = document.getElementById('results');
-            container.innerHTML = '<h3>Search Results</h3>';
-            if (!results || results.length === 0) {
-                container.innerHTML += '<p>No results found</p>';
-                return;
-            }
-            results.forEach((item, index) => {
-                const div = document.createElement('div');
-                div.className = 'result';
-                div.innerHTML = `
-                    <strong>${index + 1}. ${item.title || 'No title'}</strong><br/>
-                    <small>Doc ID: ${item.doc_id || 'N/A'}</small><br/>
-                    <small><a href="${item.url || '#'}" target="_blank">${item.url || 'No URL'}</a></small><br/>
-                    <em>${item.snippet || 'No snippet available'}</em>
-                `;
-                container.appendChild(div);
-            });
-        }
-        
-        function chatter(role, content) {
-            const chat = document.getElementById('chat');
-            const div = document.createElement('div');
-            div.className = `message ${role}`;
-            div.innerHTML = `<strong>${role === 'user' ? 'You' : 'Assistant'}:</strong> ${content}`;
-            chat.appendChild(div);
-            chat.scrollTop = chat.scrollHeight;
-        }
-        
-        // Enter key support
-        document.getElementById('query').addEventListener('keypress', function(e) {
-            if (e.key === 'Enter') runSearch();
-        });
-        document.getElementById('message').addEventListener('keypress', function(e) {
-            if (e.key === 'Enter') sendMessage();
-        });
-    </script>
-</body>
-</html>
-"""
+
+
+@app.post("/search/log")
+async def search_from_log(req: LogSearchRequest):
+    return await _search_from_log(req)
+
+
+@app.post("/search/log/batch")
+async def search_from_log_batch(req: LogBatchRequest):
+    return {"batch_id": await _submit_log_batch(req.items)}
+
+
+@app.get("/search/log/batch/{batch_id}")
+async def search_from_log_batch_status(batch_id: str):
+    return await _collect_log_batch(batch_id)
+
+
+@app.get("/document/{doc_id}")
+async def get_document(doc_id: str):
+    return await _fetch_document(doc_id)
+
+
+@app.post("/chat")
+async def chat(req: ChatRequest):
+    _get_openai_client()
+    messages = _chat_messages(req)
+    for _ in range(MAX_TOOL_ROUNDS):
+        completion = await _throttled_create(model=OPENAI_MODEL, messages=messages, tools=LLM_TOOLS)
+        message = completion.choices[0].message
+        if not message.tool_calls:
+            return {"reply": message.content or ""}
+        messages.append(message.model_dump(exclude_none=True))
+        for call in message.tool_calls:
+            result = await _dispatch_tool(call.function.name, call.function.arguments)
+            messages.append({"role": "tool", "tool_call_id": call.id, "content": _dumps(result)})
+    raise HTTPException(status_code=502, detail="LLM did not finish after tool calls")
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    # Fail with a plain HTTP error before the stream starts if OpenAI is not configured
+    _get_openai_client()
+    return StreamingResponse(
+        _sse_gen(_chat_messages(req)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/", include_in_schema=False)
+async def root(request: Request):
+    headers = {"Cache-Control": "public, max-age=3600", "ETag": _INDEX_ETAG}
+    if request.headers.get("if-none-match") == _INDEX_ETAG:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(INDEX_HTML, media_type="text/html", headers=headers)
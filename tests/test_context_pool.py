@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import mos_agent
+
+
+class FakeContext:
+    def __init__(self, slot, close_gate=None):
+        self._mos_slot = slot
+        self._mos_closed = False
+        self._close_gate = close_gate
+
+    async def close(self):
+        if self._close_gate is not None:
+            await self._close_gate.wait()
+        self._mos_closed = True
+
+
+def _fake_launcher(launched, close_gate=None):
+    async def launch(headless, slot):
+        ctx = FakeContext(slot, close_gate)
+        launched.append(ctx)
+        return ctx
+
+    return launch
+
+
+def test_acquire_while_reaper_closes_stale_context(monkeypatch):
+    async def scenario():
+        launched = []
+        close_gate = asyncio.Event()
+        monkeypatch.setattr(mos_agent, "_launch_context", _fake_launcher(launched, close_gate))
+        pool = mos_agent._ContextPool(headless=True, size=2)
+        await pool.warm_up(2)
+        stale, fresh = launched
+        # Age the first idle context past the idle limit
+        pool._idle = asyncio.Queue()
+        pool._idle.put_nowait((stale, time.monotonic() - 100))
+        pool._idle.put_nowait((fresh, time.monotonic()))
+
+        reaper = asyncio.create_task(pool.close_idle(10))
+        await asyncio.sleep(0)  # reaper is now blocked inside stale.close()
+
+        async with pool.acquire() as ctx:
+            assert ctx is fresh
+            # The second acquire must relaunch on the freed slot once it is released
+            second = asyncio.create_task(pool.acquire().__aenter__())
+            await asyncio.sleep(0)
+            assert not second.done()
+            close_gate.set()
+            assert await reaper == 1
+            replacement = await second
+            assert replacement._mos_slot == stale._mos_slot
+            assert stale._mos_closed
+
+        assert pool.stats()["created"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_close_idle_keeps_fresh_contexts(monkeypatch):
+    async def scenario():
+        launched = []
+        monkeypatch.setattr(mos_agent, "_launch_context", _fake_launcher(launched))
+        pool = mos_agent._ContextPool(headless=True, size=2)
+        await pool.warm_up(2)
+        assert await pool.close_idle(60) == 0
+        assert pool.stats()["idle"] == 2
+        assert await pool.close_idle(-1) == 2
+        assert sorted(pool._free_slots) == [0, 1]
+
+    asyncio.run(scenario())
+
+
+def test_failed_close_does_not_strand_other_slots(monkeypatch):
+    async def scenario():
+        launched = []
+        monkeypatch.setattr(mos_agent, "_launch_context", _fake_launcher(launched))
+        pool = mos_agent._ContextPool(headless=True, size=2)
+        await pool.warm_up(2)
+
+        async def broken_close():
+            raise RuntimeError("Connection closed")
+
+        launched[0].close = broken_close
+        assert await pool.close_idle(-1) == 2
+        assert not pool._closing
+
+        async def hold():
+            async with pool.acquire() as ctx:
+                await asyncio.sleep(0)
+                return ctx._mos_slot
+
+        slots = await asyncio.wait_for(asyncio.gather(hold(), hold()), 1)
+        assert sorted(slots) == [0, 1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import mos_agent
+
+
+def test_custom_id_round_trips_colons():
+    assert mos_agent._split_batch_custom_id("3:host:db1:alert.log") == ("host:db1:alert.log", 3)
+
+
+def test_unprefixed_custom_id_keeps_the_default_limit():
+    default = mos_agent.MAX_GENERATED_QUERIES
+    assert mos_agent._split_batch_custom_id("log-0") == ("log-0", default)
+    assert mos_agent._split_batch_custom_id("db1:alert") == ("db1:alert", default)
+    assert mos_agent._split_batch_custom_id("") == ("", default)
+
+
+class FakeBatchClient:
+    def __init__(self, files, error=None):
+        self._files = files
+        self._error = error
+        self.batches = SimpleNamespace(retrieve=self._retrieve)
+        self.files = SimpleNamespace(content=self._content)
+
+    async def _retrieve(self, batch_id):
+        if self._error is not None:
+            raise self._error
+        return SimpleNamespace(
+            id=batch_id,
+            status="completed",
+            request_counts=None,
+            output_file_id="out" if "out" in self._files else None,
+            error_file_id="err" if "err" in self._files else None,
+        )
+
+    async def _content(self, file_id):
+        return SimpleNamespace(text="\n".join(json.dumps(r) for r in self._files[file_id]))
+
+
+def _completion(content):
+    return {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}}
+
+
+def test_collect_splits_ids_and_keeps_error_records(monkeypatch):
+    generated = {"chunks": [{"chunk": 1, "queries": ["ORA-600", "ORA-7445", "TNS-12535"]}]}
+    files = {
+        "out": [
+            {"custom_id": "2:db1:alert", "response": _completion(json.dumps(generated))},
+            {"custom_id": "5:bad", "response": _completion("not json")},
+        ],
+        "err": [
+            {"custom_id": "5:gone", "error": {"code": "batch_expired"}},
+            {"custom_id": "5:limited", "response": {"status_code": 429, "body": {"error": "rate"}}},
+        ],
+    }
+    monkeypatch.setattr(mos_agent, "_get_openai_client", lambda: FakeBatchClient(files))
+    status = asyncio.run(mos_agent._collect_log_batch("batch_1"))
+    assert status["results"] == [
+        {"custom_id": "db1:alert", "generated_queries": ["ORA-600", "ORA-7445"]},
+        {"custom_id": "bad", "error": "malformed query JSON"},
+        {"custom_id": "gone", "error": {"code": "batch_expired"}},
+        {"custom_id": "limited", "error": {"error": "rate"}},
+    ]
+
+
+def test_unknown_batch_is_a_404(monkeypatch):
+    request = httpx.Request("GET", "https://api.openai.com/v1/batches/nope")
+    missing = openai.NotFoundError(
+        "No batch found", response=httpx.Response(404, request=request), body=None
+    )
+    monkeypatch.setattr(mos_agent, "_get_openai_client", lambda: FakeBatchClient({}, missing))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(mos_agent._collect_log_batch("nope"))
+    assert exc.value.status_code == 404
+    assert TestClient(mos_agent.app).get("/search/log/batch/nope").status_code == 404
@@ -0,0 +1,37 @@
+import mos_agent
+
+
+def test_internal_errors_keep_their_first_argument():
+    log = (
+        "ORA-00600: internal error code, arguments: [kdsgrp1], [], []\n"
+        "ora-7445: exception encountered: core dump [kglpnal()+120] [SIGSEGV]\n"
+    )
+    assert mos_agent._extract_log_signatures(log) == ["ORA-00600 kdsgrp1", "ORA-7445 kglpnal()+120"]
+
+
+def test_codes_are_case_insensitive_and_upper_cased():
+    log = "tns-12535: TNS:operation timed out\nBEA-000337 stuck thread\nORA-12 too short"
+    assert mos_agent._extract_log_signatures(log) == ["TNS-12535", "BEA-000337"]
+
+
+def test_exception_classes_need_a_package():
+    log = (
+        "Caused by: java.sql.SQLRecoverableException: Closed Connection\n"
+        "at weblogic.jdbc.common.internal.ResourceDeadException\n"
+        "plain RuntimeException without a package\n"
+    )
+    assert mos_agent._extract_log_signatures(log) == [
+        "java.sql.SQLRecoverableException",
+        "weblogic.jdbc.common.internal.ResourceDeadException",
+    ]
+
+
+def test_signatures_are_deduped_in_first_seen_order():
+    log = (
+        "ORA-01555 snapshot too old\n"
+        "ORA-00600: arguments: [kdsgrp1]\n"
+        "ora-01555 again\n"
+        "ORA-00600: arguments: [kdsgrp1]\n"
+        "ORA-00600 without arguments\n"
+    )
+    assert mos_agent._extract_log_signatures(log) == ["ORA-01555", "ORA-00600 kdsgrp1", "ORA-00600"]
@@ -0,0 +1,61 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from cachetools import TTLCache
+from fastapi.testclient import TestClient
+
+import mos_agent
+
+
+def _patch_browser(monkeypatch, results):
+    """Replace Playwright with a canned result per query and record what ran."""
+    ran = []
+    monkeypatch.setattr(mos_agent, "_search_cache", TTLCache(maxsize=16, ttl=60))
+
+    @asynccontextmanager
+    async def acquire_context(headless):
+        yield object()
+
+    async def run_one(ctx, query, max_per_query):
+        ran.append(query)
+        return [dict(row, query=query) for row in results.get(query.lower(), [])]
+
+    monkeypatch.setattr(mos_agent, "_acquire_context", acquire_context)
+    monkeypatch.setattr(mos_agent, "_run_one", run_one)
+    return ran
+
+
+def test_duplicate_queries_run_once_case_insensitively(monkeypatch):
+    ran = _patch_browser(monkeypatch, {"ora-600": [{"title": "Doc"}]})
+    out = asyncio.run(mos_agent._execute_queries(["ORA-600", " ora-600 ", "", "  "], 5))
+    assert ran == ["ORA-600"]
+    assert [row["title"] for row in out] == ["Doc"]
+
+
+def test_cache_hit_skips_the_browser(monkeypatch):
+    ran = _patch_browser(monkeypatch, {"ora-600": [{"title": "Doc"}]})
+    first = asyncio.run(mos_agent._execute_queries(["ORA-600"], 5))
+    second = asyncio.run(mos_agent._execute_queries(["ora-600"], 5))
+    assert ran == ["ORA-600"]
+    assert second == first
+    # A different page size is a different cache entry
+    asyncio.run(mos_agent._execute_queries(["ORA-600"], 3))
+    assert ran == ["ORA-600", "ORA-600"]
+
+
+def test_empty_results_are_not_cached(monkeypatch):
+    ran = _patch_browser(monkeypatch, {})
+    asyncio.run(mos_agent._execute_queries(["nothing here"], 5))
+    asyncio.run(mos_agent._execute_queries(["nothing here"], 5))
+    assert ran == ["nothing here", "nothing here"]
+    assert len(mos_agent._search_cache) == 0
+
+
+def test_search_reports_x_cache(monkeypatch):
+    _patch_browser(monkeypatch, {"ora-600": [{"title": "Doc"}]})
+    client = TestClient(mos_agent.app)
+    body = {"queries": ["ORA-600"]}
+    assert client.post("/search", json=body).headers["X-Cache"] == "MISS"
+    assert client.post("/search", json=body).headers["X-Cache"] == "HIT"
+    assert client.post("/search", json={"queries": ["ORA-600", "other"]}).headers["X-Cache"] == "MISS"
+    assert client.post("/search", json={"queries": [" "]}).headers["X-Cache"] == "MISS"
@@ -0,0 +1,116 @@
+import asyncio
+
+import mos_agent
+
+
+class FakeTimeout(Exception):
+    pass
+
+
+class FakeLocator:
+    """Matches when any of its selectors is among the page's visible ones."""
+
+    def __init__(self, page, selectors):
+        self.page = page
+        self.selectors = selectors
+
+    def locator(self, selector):
+        assert selector == "visible=true"
+        return self
+
+    @property
+    def first(self):
+        return self
+
+    def or_(self, other):
+        return FakeLocator(self.page, self.selectors + other.selectors)
+
+    async def count(self):
+        self.page.calls.append(("count", tuple(self.selectors)))
+        return int(any(s in self.page.visible for s in self.selectors))
+
+    async def wait_for(self, state, timeout):
+        self.page.calls.append(("wait", tuple(self.selectors)))
+        self.page.timeouts.append(timeout)
+        if not await self.count():
+            raise FakeTimeout()
+
+
+class FakeContext:
+    def __init__(self):
+        self._mos_selector_cache = {}
+
+
+class FakePage:
+    def __init__(self, visible):
+        self.visible = set(visible)
+        self.context = FakeContext()
+        self.calls = []
+        self.timeouts = []
+
+    def locator(self, selector):
+        # A CSS union matches if any of its members does
+        return FakeLocator(self, [s.strip() for s in selector.split(", ")])
+
+    def get_by_role(self, role, name):
+        return FakeLocator(self, [f'aria/{name}[role="{role}"]'])
+
+
+def _patch_playwright(monkeypatch):
+    class FakeModule:
+        TimeoutError = FakeTimeout
+
+    monkeypatch.setattr(mos_agent, "_pw", lambda: FakeModule)
+
+
+def test_specific_selector_beats_earlier_generic_match(monkeypatch):
+    _patch_playwright(monkeypatch)
+    exact = mos_agent.SEARCH_BOX_SELECTORS[0]
+    page = FakePage({'input[type="search"]', exact})
+    loc = asyncio.run(mos_agent._first_matching(page, "search_box"))
+    assert loc.selectors == [exact]
+    assert page.context._mos_selector_cache["search_box"] == exact
+
+
+def test_aria_selector_keeps_its_priority(monkeypatch):
+    _patch_playwright(monkeypatch)
+    page = FakePage({mos_agent.GLOBAL_SEARCH_ARIA, 'input[id*="search" i]'})
+    asyncio.run(mos_agent._first_matching(page, "search_box"))
+    assert page.context._mos_selector_cache["search_box"] == mos_agent.GLOBAL_SEARCH_ARIA
+
+
+def test_cache_hit_probes_only_the_cached_candidate(monkeypatch):
+    _patch_playwright(monkeypatch)
+    page = FakePage({'input[type="search"]'})
+    asyncio.run(mos_agent._first_matching(page, "search_box"))
+    page.calls.clear()
+    asyncio.run(mos_agent._first_matching(page, "search_box"))
+    assert page.calls == [("wait", ('input[type="search"]',)), ("count", ('input[type="search"]',))]
+
+
+def test_missing_family_returns_none(monkeypatch):
+    _patch_playwright(monkeypatch)
+    page = FakePage(set())
+    assert asyncio.run(mos_agent._first_matching(page, "login_submit", timeout=10)) is None
+    assert "login_submit" not in page.context._mos_selector_cache
+
+
+def test_stale_cache_gets_a_short_probe_and_is_replaced(monkeypatch):
+    _patch_playwright(monkeypatch)
+    page = FakePage({'input[id*="search" i]'})
+    page.context._mos_selector_cache["search_box"] = 'input[type="search"]'
+    asyncio.run(mos_agent._first_matching(page, "search_box", timeout=5000))
+    assert page.timeouts == [mos_agent.CACHED_SELECTOR_PROBE_MS, 5000]
+    assert page.context._mos_selector_cache["search_box"] == 'input[id*="search" i]'
+
+
+def test_cache_survives_a_field_that_is_not_rendered_yet(monkeypatch):
+    _patch_playwright(monkeypatch)
+    password = mos_agent.LOGIN_PASSWORD_SELECTORS[-1]
+    page = FakePage(set())
+    page.context._mos_selector_cache["login_password"] = password
+    assert asyncio.run(mos_agent._first_matching(page, "login_password", timeout=1000)) is None
+    page.visible.add(password)
+    page.calls.clear()
+    asyncio.run(mos_agent._first_matching(page, "login_password"))
+    assert page.calls == [("wait", (password,)), ("count", (password,))]